@@ -7,6 +7,10 @@ import threading
 import argparse
 import json
 import time
+import fnmatch
+import queue
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 import re
 import subprocess
@@ -18,81 +22,430 @@ CONFIG_FILE = os.path.join(CONFIG_DIR, "config.json")
 
 # Default configuration
 DEFAULT_CONFIG = {
-    "ignored_patterns": ["__pycache__", "*.pyc", "*.pyo", "*.jpg", "*.png", "*.gif", "*.pdf"],
+    "ignored_patterns": ["__pycache__", "node_modules", "*.pyc", "*.pyo", "*.jpg", "*.png", "*.gif", "*.pdf"],
     "recent_directories": [],
-    "window_size": [800, 600]
+    "window_size": [800, 600],
+    "content_cache_size": 4096,
+    "content_cache_chars": 32 * 1024 * 1024,
+    "config_version": 1
 }
 
+# Number of rows inserted into the tree before giving control back to Tk
+INSERT_BATCH_SIZE = 500
+
+# Number of characters handed to the clipboard per call
+CLIPBOARD_CHUNK_SIZE = 1 << 20
+
 # Ensure config directory exists
 os.makedirs(CONFIG_DIR, exist_ok=True)
 
+# Configuration loaded by load_config, kept for the life of the process
+_config_cache = None
+
 # Load or create configuration
 def load_config():
+    global _config_cache
+    if _config_cache is not None:
+        return _config_cache
+    
     try:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
+                config = json.load(f)
+            
+            # Configs saved before node_modules became an ignored pattern
+            # relied on it being skipped, so add it once
+            if config.get("config_version", 0) < 1:
+                patterns = config.setdefault("ignored_patterns", list(DEFAULT_CONFIG["ignored_patterns"]))
+                if "node_modules" not in patterns:
+                    patterns.append("node_modules")
+                config["config_version"] = 1
+                save_config(config)
+            
+            _config_cache = config
         else:
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(DEFAULT_CONFIG, f, indent=2)
-            return DEFAULT_CONFIG
+            save_config(DEFAULT_CONFIG)
+            _config_cache = DEFAULT_CONFIG
     except Exception as e:
         print(f"Error loading config: {e}")
         return DEFAULT_CONFIG
+    return _config_cache
 
 # Save configuration
 def save_config(config):
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        # Write a temporary file and swap it in, so a crash never leaves a truncated config
+        tmp_file = CONFIG_FILE + ".tmp"
+        with open(tmp_file, 'w') as f:
             json.dump(config, f, indent=2)
+        os.replace(tmp_file, CONFIG_FILE)
     except Exception as e:
         print(f"Error saving config: {e}")
 
-# Cache for file contents to improve performance
-@lru_cache(maxsize=100)
-def get_file_content(file_path):
+class ConfigWriter:
+    """Daemon thread that writes the config to disk off the Tk thread"""
+    
+    def __init__(self, delay=0.25):
+        self.delay = delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._written = 0
+        
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def save(self, config):
+        """Queue a snapshot of the config to be written"""
+        # Values are replaced rather than mutated, so a shallow copy is a snapshot
+        self._version += 1
+        self._queue.put((self._version, dict(config)))
+    
+    def flush(self, config):
+        """Write the config right away, superseding any queued save"""
+        with self._lock:
+            self._version += 1
+            save_config(config)
+            self._written = self._version
+    
+    def _run(self):
+        """Write queued configs until the process exits"""
+        while True:
+            version, config = self._queue.get()
+            time.sleep(self.delay)
+            
+            # Coalesce to the latest config
+            try:
+                while True:
+                    version, config = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            
+            with self._lock:
+                if version > self._written:
+                    save_config(config)
+                    self._written = version
+
+def read_file_content(file_path):
     """Get the full content of a file, with proper error handling"""
     try:
-        # Check if file exists and is readable
-        if not os.path.isfile(file_path) or not os.access(file_path, os.R_OK):
+        # Check if file exists (open() would block on a FIFO)
+        if not os.path.isfile(file_path):
             return "(Файл недоступен для чтения)"
         
-        # Skip binary files quickly by checking first few bytes
         with open(file_path, 'rb') as f:
-            first_bytes = f.read(8192)
-            if b'\x00' in first_bytes:
+            # Skip binary files by checking first few bytes, before the rest is read
+            data = f.read(8192)
+            if b'\x00' in data:
                 return "(Бинарный файл, содержимое не отображается)"
+            data += f.read()
         
-        # Read text content (full file)
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+        content = data.decode('utf-8', 'replace')
+        # Translate newlines like text mode does
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
         return content
-    except UnicodeDecodeError:
-        return "(Бинарный файл, содержимое не отображается)"
+    except PermissionError:
+        return "(Файл недоступен для чтения)"
     except Exception as e:
         return f"(Ошибка чтения файла: {str(e)})"
 
-def should_ignore(path, ignore_patterns):
-    """Check if a file/directory should be ignored based on patterns"""
-    filename = os.path.basename(path)
-    
-    for pattern in ignore_patterns:
-        # Direct match
-        if pattern == filename:
-            return True
-        # Path contains pattern
-        if pattern in path:
-            return True
-        # Wildcard extension match (*.ext)
-        if pattern.startswith('*.') and filename.endswith(pattern[1:]):
-            return True
-        # Regex match for more complex patterns
-        try:
-            if re.match(f"^{pattern.replace('*', '.*')}$", filename):
-                return True
-        except:
-            pass
-    return False
+class ContentCache:
+    """LRU cache of file contents bounded by file count and total size"""
+    
+    def __init__(self, max_files, max_chars):
+        self.max_files = max_files
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, path, version):
+        """Get the cached content of a file at a version, or None"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+    
+    def put(self, path, version, content):
+        """Cache the content of a file, evicting the least recently used ones"""
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.total_chars -= len(old[1])
+            
+            # Content larger than the whole cache would only evict everything else
+            if len(content) > self.max_chars:
+                return
+            
+            self._entries[path] = (version, content)
+            self.total_chars += len(content)
+            
+            while self._entries and (len(self._entries) > self.max_files or self.total_chars > self.max_chars):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_chars -= len(evicted)
+
+# Cache for file contents to improve performance
+content_cache = ContentCache(DEFAULT_CONFIG["content_cache_size"], DEFAULT_CONFIG["content_cache_chars"])
+
+def configure_content_cache(max_files, max_chars):
+    """Replace the file content cache with one of the given limits"""
+    global content_cache
+    content_cache = ContentCache(max_files, max_chars)
+
+def get_file_content(file_path):
+    """Get the content of a file, cached until the file is modified"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return read_file_content(file_path)
+    
+    version = (stat.st_mtime_ns, stat.st_size)
+    content = content_cache.get(file_path, version)
+    if content is None:
+        content = read_file_content(file_path)
+        content_cache.put(file_path, version, content)
+    return content
+
+class IgnoreMatcher:
+    """Ignored patterns compiled once into the cheapest test for each kind"""
+    __slots__ = ("literals", "prefixes", "suffixes", "contains", "rx", "has_patterns")
+    
+    def __init__(self, literals, prefixes, suffixes, contains, rx):
+        self.literals = literals
+        self.prefixes = prefixes
+        self.suffixes = suffixes
+        self.contains = contains
+        self.rx = rx
+        # Without patterns nothing is ignored and the check can be skipped
+        self.has_patterns = bool(literals or prefixes or suffixes or contains or rx is not None)
+    
+    def filter_rows(self, rows, rel_dir):
+        """Return the (sort key, name, path) rows of a directory that are not ignored"""
+        literals = self.literals
+        prefixes = self.prefixes
+        suffixes = self.suffixes
+        rows = [row for row in rows
+                if row[1] not in literals
+                and not row[1].startswith(prefixes)
+                and not row[1].endswith(suffixes)]
+        
+        # Path patterns are matched against the path relative to the loaded root
+        for part in self.contains:
+            rows = [row for row in rows if part not in rel_dir + row[1]]
+        
+        if self.rx is not None:
+            match = self.rx.match
+            rows = [row for row in rows if match(row[1]) is None]
+        return rows
+
+def compile_ignore(patterns):
+    """Compile the ignored patterns into an IgnoreMatcher"""
+    return _compile_ignore(tuple(patterns))
+
+# Refreshing with unchanged patterns reuses the compiled matcher
+@lru_cache(maxsize=8)
+def _compile_ignore(patterns):
+    literals = set()
+    prefixes = []
+    suffixes = []
+    contains = []
+    globs = []
+    
+    def has_wildcard(text):
+        return any(c in text for c in "*?[")
+    
+    for pattern in patterns:
+        if not has_wildcard(pattern):
+            if "/" in pattern or os.sep in pattern:
+                # Path contains pattern
+                contains.append(pattern.replace(os.sep, "/"))
+            else:
+                # Direct match
+                literals.add(pattern)
+        elif pattern.startswith("*") and not has_wildcard(pattern[1:]):
+            # Wildcard extension match (*.ext)
+            suffixes.append(pattern[1:])
+        elif pattern.endswith("*") and not has_wildcard(pattern[:-1]):
+            # Wildcard prefix match (name*)
+            prefixes.append(pattern[:-1])
+        else:
+            # Any other glob; drop invalid ones so one bad pattern cannot
+            # break the combined regex
+            try:
+                re.compile(fnmatch.translate(pattern))
+            except re.error as e:
+                print(f"Warning: ignoring invalid pattern {pattern!r}: {e}")
+                continue
+            globs.append(pattern)
+    
+    rx = re.compile("|".join(fnmatch.translate(p) for p in globs)) if globs else None
+    return IgnoreMatcher(frozenset(literals), tuple(prefixes), tuple(suffixes), tuple(contains), rx)
+
+def scan_directory(directory, root, matcher):
+    """List a directory as sorted (name, path, is_dir) rows, or None if nothing could be listed"""
+    # Split into directories and files in a single pass over all entries,
+    # including hidden ones. Each row carries its sort key so it is only
+    # computed once.
+    dirs = []
+    files = []
+    
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                name = entry.name
+                
+                # DirEntry caches the type from readdir, so this only stats symlinks
+                if entry.is_dir():
+                    dirs.append((name.casefold(), name, entry.path))
+                else:
+                    files.append((name.casefold(), name, entry.path))
+    except PermissionError:
+        return None
+    except Exception as e:
+        print(f"Error scanning {directory}: {e}")
+        return None
+    
+    # Nothing could be listed; a directory whose entries are all ignored is
+    # reported as empty rows instead
+    if not dirs and not files:
+        return None
+    
+    # Skip ignored items, pruning each group in one batch
+    if matcher.has_patterns:
+        # Relative path of the directory below the root, with "/" separators
+        rel_dir = os.path.relpath(directory, root).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir + "/"
+        
+        dirs = matcher.filter_rows(dirs, rel_dir)
+        files = matcher.filter_rows(files, rel_dir)
+    
+    # Sort each group alphabetically
+    dirs.sort()
+    files.sort()
+    
+    return ([(name, path, True) for _, name, path in dirs]
+            + [(name, path, False) for _, name, path in files])
+
+class Node:
+    """Metadata kept for every file or directory item in the tree"""
+    __slots__ = ("path", "is_dir", "checked", "expanded")
+    
+    def __init__(self, path, is_dir, checked=False):
+        self.path = path
+        self.is_dir = is_dir
+        self.checked = checked
+        # Whether the children of a directory have been loaded
+        self.expanded = False
+
+def list_directory(directory, root, matcher):
+    """Scan one directory into (rows, error) for insertion into the tree"""
+    try:
+        rows = scan_directory(directory, root, matcher)
+        if rows is None:
+            return [], "Error: Permission denied or empty directory"
+        return rows, None
+    except Exception as e:
+        return [], f"Error: {str(e)}"
+
+class DirectoryScanner:
+    """Pool of worker threads that scan directories off the Tk thread"""
+    
+    def __init__(self, workers=16):
+        self.results = queue.Queue()
+        self.generation = 0
+        self.root = None
+        self._paths = deque()
+        self._condition = threading.Condition()
+        
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+    
+    def start(self, parent, directory, matcher):
+        """Drop any pending work and start scanning a new tree"""
+        with self._condition:
+            self.generation += 1
+            self.root = directory
+            self._paths.clear()
+        self.submit(parent, directory, matcher)
+    
+    def submit(self, parent, directory, matcher):
+        """Queue one directory to be scanned for the current tree"""
+        with self._condition:
+            self._paths.append((self.generation, parent, directory, self.root, matcher))
+            self._condition.notify()
+    
+    def _worker(self):
+        """Scan directories from the deque until the process exits"""
+        while True:
+            with self._condition:
+                while not self._paths:
+                    self._condition.wait()
+                generation, parent, directory, root, matcher = self._paths.pop()
+            
+            rows, error = list_directory(directory, root, matcher)
+            self.results.put((generation, parent, rows, error))
+
+def process_items_for_output(children, root, matcher, parts, contents):
+    """Append the output for a tree snapshot to parts, walking with an explicit stack"""
+    # Items still to be written as (node, prefix, is last sibling, real paths
+    # of the directories above it), with the next one on top. Checked files
+    # get an empty slot in parts and an (index, path, prefix) tuple in
+    # contents, so they can be filled in later.
+    stack = []
+    
+    def push_children(children, prefix, ancestors):
+        last = len(children) - 1
+        for i in range(last, -1, -1):
+            stack.append((children[i], prefix, i == last, ancestors))
+    
+    push_children(children, "", frozenset([os.path.realpath(root)]) if root else frozenset())
+    
+    while stack:
+        node, prefix, is_last, ancestors = stack.pop()
+        if node is None:
+            continue
+        
+        # Get item properties
+        path, is_dir, checked, children = node
+        name = os.path.basename(path)
+        item_prefix = prefix + ("└── " if is_last else "├── ")
+        child_prefix = prefix + ("    " if is_last else "│   ")
+        
+        parts.append(item_prefix + name + "\n")
+        
+        # For files, include content if checked
+        if not is_dir:
+            if checked:
+                contents.append((len(parts), path, child_prefix))
+                parts.append(None)
+                parts.append(child_prefix + "-" * 40 + "\n")
+            else:
+                parts.append(child_prefix + "<-- Content skipped -->\n")
+        
+        # For directories, process children
+        else:
+            # Symlinked directories are followed, but never back into one of their parents
+            real_path = os.path.realpath(path)
+            if real_path in ancestors:
+                parts.append(child_prefix + "<-- symlink loop (skipped) -->\n")
+                continue
+            ancestors = ancestors | {real_path}
+            
+            if children is None:
+                # Never opened, so list it from disk; its items inherit its check state
+                rows, error = list_directory(path, root, matcher)
+                if error:
+                    children = [None]
+                else:
+                    children = [(row_path, row_is_dir, checked, None) for _, row_path, row_is_dir in rows]
+            
+            if children:
+                push_children(children, child_prefix, ancestors)
+            else:
+                # Empty directory
+                parts.append(child_prefix + "(empty directory)\n")
 
 class FileTreeViewer(tk.Tk):
     def __init__(self, initial_dir=None):
@@ -100,6 +453,11 @@ class FileTreeViewer(tk.Tk):
         
         # Load configuration
         self.config_data = load_config()
+        self.config_writer = ConfigWriter()
+        configure_content_cache(
+            self.config_data.get("content_cache_size", DEFAULT_CONFIG["content_cache_size"]),
+            self.config_data.get("content_cache_chars", DEFAULT_CONFIG["content_cache_chars"])
+        )
         
         # Setup main window
         self.title("File Tree Viewer")
@@ -130,8 +488,16 @@ class FileTreeViewer(tk.Tk):
         self.current_dir = tk.StringVar(value=initial_dir or os.getcwd())
         self.status_text = tk.StringVar(value="Ready")
         self.is_loading = False
+        self.is_generating = False
         self.tree_items = {}
-        self.checked_items = set()
+        self._next_id = 0
+        self.scanner = DirectoryScanner()
+        self.pending_scans = 0
+        self.loaded_dir = None
+        self.refreshing = set()
+        self.pending_inserts = deque()
+        self.drain_job = None
+        self.ignore_matcher = None
         
         # Create main frame with padding
         main_frame = ttk.Frame(self, padding="10")
@@ -198,6 +564,7 @@ class FileTreeViewer(tk.Tk):
         # Bind tree events
         self.tree.bind("<Double-1>", self.on_tree_double_click)
         self.tree.bind("<Button-1>", self.on_tree_click)
+        self.tree.bind("<<TreeviewOpen>>", self.on_expand)
         
         # Status bar
         status_bar = ttk.Label(main_frame, textvariable=self.status_text, relief=tk.SUNKEN, anchor=tk.W)
@@ -227,13 +594,12 @@ class FileTreeViewer(tk.Tk):
         file_menu = tk.Menu(menu_bar, tearoff=0)
         file_menu.add_command(label="Open Directory...", command=self.browse_directory)
         
-        # Recent directories submenu
-        self.recent_menu = tk.Menu(file_menu, tearoff=0)
-        for directory in self.config_data.get("recent_directories", []):
-            self.recent_menu.add_command(
-                label=directory, 
-                command=lambda d=directory: self.load_directory(d)
-            )
+        # Recent directories submenu; all entries share one Tcl command that
+        # receives the entry's index. Entries are only built when the menu is
+        # posted, and rebuilt after the recent list changes
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.update_recent_menu)
+        self.load_recent_command = self.register(self.load_recent_directory)
+        self.recent_menu_dirty = True
         
         file_menu.add_cascade(label="Recent Directories", menu=self.recent_menu)
         file_menu.add_separator()
@@ -255,33 +621,43 @@ class FileTreeViewer(tk.Tk):
         self.config(menu=menu_bar)
     
     def update_recent_menu(self):
-        """Update the recent directories menu"""
+        """Update the recent directories menu if the recent list changed"""
+        if not self.recent_menu_dirty:
+            return
+        self.recent_menu_dirty = False
+        
         self.recent_menu.delete(0, tk.END)
-        for directory in self.config_data.get("recent_directories", []):
+        for index, directory in enumerate(self.config_data.get("recent_directories", [])):
             self.recent_menu.add_command(
                 label=directory, 
-                command=lambda d=directory: self.load_directory(d)
+                command=(self.load_recent_command, index)
             )
     
+    def load_recent_directory(self, index):
+        """Load the recent directory at the given menu index"""
+        recent = self.config_data.get("recent_directories", [])
+        index = int(index)
+        if index < len(recent):
+            self.load_directory(recent[index])
+    
     def add_recent_directory(self, directory):
         """Add a directory to recent list"""
-        recent = self.config_data.get("recent_directories", [])
+        # Keep only last 10
+        recent = deque(self.config_data.get("recent_directories", []), maxlen=10)
         
         # Remove if already exists
         if directory in recent:
             recent.remove(directory)
         
         # Add to beginning
-        recent.insert(0, directory)
-        
-        # Keep only last 10
-        self.config_data["recent_directories"] = recent[:10]
+        recent.appendleft(directory)
+        self.config_data["recent_directories"] = list(recent)
         
         # Save config
-        save_config(self.config_data)
+        self.config_writer.save(self.config_data)
         
-        # Update menu
-        self.update_recent_menu()
+        # Rebuild the menu the next time it is posted
+        self.recent_menu_dirty = True
     
     def browse_directory(self):
         """Open directory browser dialog"""
@@ -306,139 +682,219 @@ class FileTreeViewer(tk.Tk):
         self.status_text.set("Loading directory structure...")
         self.update_idletasks()
         
-        # Clear existing tree
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        self.tree_items = {}
-        self.checked_items = set()
+        # Compile the ignored patterns from config once per load
+        ignored_patterns = self.config_data.get("ignored_patterns", DEFAULT_CONFIG["ignored_patterns"])
+        self.ignore_matcher = compile_ignore(ignored_patterns)
         
-        # Start loading thread
         directory = self.current_dir.get()
         
-        threading.Thread(target=self.load_tree_thread, args=(directory,), daemon=True).start()
-    
-    def load_tree_thread(self, directory):
-        """Background thread to load tree structure"""
-        try:
-            # Get the ignored patterns from config
-            ignored_patterns = self.config_data.get("ignored_patterns", DEFAULT_CONFIG["ignored_patterns"])
-            
-            # We need to use after to update the status from the main thread
-            self.after(0, lambda: self.status_text.set("Loading directory structure..."))
+        if directory == self.loaded_dir:
+            # Rescan the root and every opened directory; their items are
+            # updated in place so unchanged ones keep their IDs and state
+            self.refreshing = {""}
+            self.scanner.submit("", directory, self.ignore_matcher)
+            for item_id, item_info in self.tree_items.items():
+                if item_info.is_dir and item_info.expanded:
+                    self.refreshing.add(item_id)
+                    self.scanner.submit(item_id, item_info.path, self.ignore_matcher)
+            self.pending_scans += len(self.refreshing)
+        else:
+            # Clear existing tree
+            for item in self.tree.get_children():
+                self.tree.delete(item)
             
-            # Populate tree
-            self.populate_tree("", directory, ignored_patterns)
+            self.tree_items = {}
+            self.refreshing = set()
+            self.pending_inserts.clear()
+            self.loaded_dir = directory
             
-            # Update status when done
-            self.after(0, lambda: self.status_text.set(f"Loaded directory: {directory}"))
-        except Exception as e:
-            # Use after to update UI from the main thread
-            self.after(0, lambda: self.status_text.set(f"Error loading directory: {str(e)}"))
-        finally:
-            # Update loading flag in the main thread
-            self.after(0, lambda: setattr(self, 'is_loading', False))
-    
-    def populate_tree(self, parent, directory, ignored_patterns):
-        """Recursively populate the tree including all files"""
+            # Hand the directory to the scanner pool
+            self.scanner.start("", directory, self.ignore_matcher)
+            self.pending_scans = 1
+        
+        self.schedule_drain()
+    
+    def schedule_drain(self, delay=30):
+        """Make sure drain_queue will run, unless it is already scheduled"""
+        if self.drain_job is None:
+            if delay is None:
+                # Run as soon as Tk has handled pending events and redraws
+                self.drain_job = self.after_idle(self.drain_queue)
+            else:
+                self.drain_job = self.after(delay, self.drain_queue)
+    
+    def drain_queue(self):
+        """Insert scanned directories into the tree from the Tk thread"""
+        self.drain_job = None
+        
         try:
-            # Function to get all files including hidden ones
-            def get_all_files(path):
-                try:
-                    all_items = []
-                    for item in os.listdir(path):
-                        item_path = os.path.join(path, item)
-                        all_items.append(item_path)
-                    return all_items
-                except PermissionError:
-                    return []
-                except Exception as e:
-                    print(f"Error scanning {path}: {e}")
-                    return []
-            
-            # Get all items
-            all_items = get_all_files(directory)
-            
-            # If no items could be retrieved, show error
-            if not all_items:
-                error_id = f"{parent}_error_{hash(directory)}"
-                self.tree.insert(parent, "end", error_id, text=f"Error: Permission denied or empty directory")
+            while True:
+                generation, parent, rows, error = self.scanner.results.get_nowait()
+                
+                # Skip results left over from a previous load
+                if generation != self.scanner.generation:
+                    continue
+                
+                self.pending_scans -= 1
+                self.populate_tree(parent, rows, error)
+        except queue.Empty:
+            pass
+        
+        # Insert in batches for up to ~50 ms, then let Tk redraw and handle input
+        deadline = time.monotonic() + 0.05
+        while self.pending_inserts and time.monotonic() < deadline:
+            self.insert_rows(*self.pending_inserts.popleft())
+        
+        if self.pending_inserts:
+            self.schedule_drain(None)
+        elif self.pending_scans:
+            self.schedule_drain()
+        elif self.is_loading:
+            # Update status when done
+            self.status_text.set(f"Loaded directory: {self.loaded_dir}")
+            self.is_loading = False
+    
+    def on_expand(self, event):
+        """Load the children of a directory the first time it is opened"""
+        item_id = self.tree.focus()
+        item_info = self.tree_items.get(item_id)
+        if not item_info or not item_info.is_dir or item_info.expanded:
+            return
+        
+        # The placeholder is replaced once the scanner reports back
+        self.scanner.submit(item_id, item_info.path, self.ignore_matcher)
+        self.pending_scans += 1
+        self.schedule_drain()
+    
+    def flush_inserts(self):
+        """Insert all queued batches right away"""
+        while self.pending_inserts:
+            self.insert_rows(*self.pending_inserts.popleft())
+    
+    def populate_tree(self, parent, rows, error):
+        """Replace the placeholder of a scanned directory and queue its rows for insertion"""
+        if parent in self.refreshing:
+            self.refreshing.discard(parent)
+            self.update_children(parent, rows, error)
+            return
+        
+        if parent:
+            # Skip directories that were already populated by another load
+            lazy_id = f"{parent}__lazy"
+            if not self.tree.exists(lazy_id):
                 return
+            self.tree.delete(lazy_id)
+            self.tree_items[parent].expanded = True
+        
+        if error:
+            self.insert_error(parent, error)
+            return
+        
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            self.pending_inserts.append((parent, rows[start:start + INSERT_BATCH_SIZE]))
+    
+    def insert_error(self, parent, error):
+        """Show an error item in place of a directory's content"""
+        error_id = f"i{self._next_id}"
+        self._next_id += 1
+        self.tree.insert(parent, "end", error_id, text=error)
+    
+    def update_children(self, parent, rows, error):
+        """Bring the children of a rescanned directory in line with its new content"""
+        # Finish inserting the previous scan so it is not added twice
+        self.flush_inserts()
+        
+        # Map existing children by path; error items are always rebuilt
+        existing = {}
+        for child_id in self.tree.get_children(parent):
+            child_info = self.tree_items.get(child_id)
+            if child_info:
+                existing[child_info.path] = child_id
+            else:
+                self.tree.delete(child_id)
+        
+        if error:
+            for child_id in existing.values():
+                self.forget_item(child_id)
+            self.insert_error(parent, error)
+            return
+        
+        # Reuse items whose path and kind are unchanged, collect the rest as new
+        order = []
+        new_rows = []
+        for row in rows:
+            item_id = existing.pop(row[1], None)
+            if item_id is not None and self.tree_items[item_id].is_dir != row[2]:
+                self.forget_item(item_id)
+                item_id = None
             
-            # Split into directories and files
-            dirs = []
-            files = []
-            
-            for item_path in all_items:
-                item_name = os.path.basename(item_path)
-                    
-                # Skip . and .. entries
-                if item_name in ['.', '..']:
-                    continue
-                    
-                # Skip ignored items
-                if should_ignore(item_path, ignored_patterns):
-                    continue
-                    
-                if os.path.isdir(item_path):
-                    dirs.append((item_name, item_path))
-                else:
-                    files.append((item_name, item_path))
+            if item_id is None:
+                new_rows.append(row)
+            order.append(item_id)
+        
+        # Delete items whose path vanished
+        for child_id in existing.values():
+            self.forget_item(child_id)
+        
+        # Insert the new items and put everything back in scan order
+        new_ids = iter(self.insert_rows(parent, new_rows))
+        self.tree.set_children(parent, *[item_id or next(new_ids) for item_id in order])
+    
+    def forget_item(self, item_id):
+        """Delete an item and drop everything kept about it and its descendants"""
+        stack = [item_id]
+        while stack:
+            current_id = stack.pop()
+            self.tree_items.pop(current_id, None)
+            self.refreshing.discard(current_id)
+            stack.extend(self.tree.get_children(current_id))
+        
+        self.tree.delete(item_id)
+    
+    def insert_rows(self, parent, rows):
+        """Insert one batch of scanned rows under their directory and return their IDs"""
+        # Skip batches whose directory was deleted by a refresh
+        if parent and parent not in self.tree_items:
+            return []
+        
+        # New children inherit the check state of their directory
+        checked = bool(parent) and self.tree_items[parent].checked
+        check_value = "✅" if checked else "⬜"
+        
+        # Local names are cheaper to look up in this loop than attributes
+        tree_insert = self.tree.insert
+        tree_items = self.tree_items
+        next_id = self._next_id
+        
+        tree_ids = []
+        for item_name, item_path, is_dir in rows:
+            # Tk only needs unique item IDs, so a counter is enough
+            unique_id = f"i{next_id}"
+            next_id += 1
             
-            # Sort each group alphabetically
-            dirs.sort(key=lambda x: x[0].lower())
-            files.sort(key=lambda x: x[0].lower())
+            if is_dir:
+                # Add directory item, with a placeholder until it is expanded
+                tree_id = tree_insert(
+                    parent, "end", unique_id, 
+                    text=item_name,
+                    values=(check_value,)
+                )
+                tree_insert(tree_id, "end", f"{tree_id}__lazy", text="…")
+                tree_items[tree_id] = Node(item_path, True, checked)
+            else:
+                # Add file item
+                tree_id = tree_insert(
+                    parent, "end", unique_id, 
+                    text=item_name,
+                    values=(check_value,)
+                )
+                tree_items[tree_id] = Node(item_path, False, checked)
             
-            # Process directories first, then files
-            for item_name, item_path in dirs + files:
-                # Generate item ID (ensure uniqueness even with special chars)
-                unique_id = f"{parent}_{str(hash(item_path))}"
-                
-                if os.path.isdir(item_path):
-                    # Add directory item
-                    if item_name == "node_modules":
-                        # Special handling for node_modules
-                        tree_id = self.tree.insert(
-                            parent, "end", unique_id, 
-                            text=f"{item_name} (skipped content)",
-                            values=("⬜", "directory", item_path)
-                        )
-                        self.tree_items[tree_id] = {
-                            "path": item_path, 
-                            "type": "directory",
-                            "is_ignored": True
-                        }
-                    else:
-                        # Normal directory
-                        tree_id = self.tree.insert(
-                            parent, "end", unique_id, 
-                            text=item_name,
-                            values=("⬜", "directory", item_path)
-                        )
-                        self.tree_items[tree_id] = {
-                            "path": item_path, 
-                            "type": "directory",
-                            "is_ignored": False
-                        }
-                        
-                        # Recursively populate subdirectory
-                        self.populate_tree(tree_id, item_path, ignored_patterns)
-                else:
-                    # Add file item
-                    tree_id = self.tree.insert(
-                        parent, "end", unique_id, 
-                        text=item_name,
-                        values=("⬜", "file", item_path)
-                    )
-                    self.tree_items[tree_id] = {
-                        "path": item_path, 
-                        "type": "file",
-                        "is_ignored": False
-                    }
-        except Exception as e:
-            # Handle errors
-            error_id = f"{parent}_error_{hash(directory)}"
-            self.tree.insert(parent, "end", error_id, text=f"Error: {str(e)}")
+            tree_ids.append(tree_id)
+        
+        self._next_id = next_id
+        
+        return tree_ids
     
     def on_tree_double_click(self, event):
         """Handle double click on tree item"""
@@ -453,7 +909,7 @@ class FileTreeViewer(tk.Tk):
             return
             
         # If it's a file, toggle its checked state
-        if item_info["type"] == "file" and not item_info["is_ignored"]:
+        if not item_info.is_dir:
             self.toggle_check(item_id)
     
     def on_tree_click(self, event):
@@ -471,72 +927,42 @@ class FileTreeViewer(tk.Tk):
     def toggle_check(self, item_id):
         """Toggle checkbox for an item"""
         item_info = self.tree_items.get(item_id)
-        if not item_info or item_info["is_ignored"]:
+        if not item_info:
             return
-            
-        current_value = self.tree.item(item_id, "values")[0]
-        new_value = "✅" if current_value == "⬜" else "⬜"
         
-        # Update tree item
-        values = list(self.tree.item(item_id, "values"))
-        values[0] = new_value
-        self.tree.item(item_id, values=values)
-        
-        # Update checked items set
-        if new_value == "✅":
-            self.checked_items.add(item_id)
-        else:
-            self.checked_items.discard(item_id)
+        checked = not item_info.checked
+        self.set_checked(item_id, item_info, checked)
         
         # If it's a directory, update all children
-        if item_info["type"] == "directory":
-            self.update_children_check(item_id, new_value == "✅")
+        if item_info.is_dir:
+            self.update_children_check(item_id, checked)
+    
+    def set_checked(self, item_id, item_info, checked):
+        """Store the check state of an item and show it in the checkbox column"""
+        item_info.checked = checked
+        # Only the checkbox cell changes, so update just that column
+        self.tree.set(item_id, "checked", "✅" if checked else "⬜")
     
     def update_children_check(self, parent_id, checked):
-        """Update check state of all children"""
-        for child_id in self.tree.get_children(parent_id):
+        """Update check state of all loaded children"""
+        stack = list(self.tree.get_children(parent_id))
+        while stack:
+            child_id = stack.pop()
             item_info = self.tree_items.get(child_id)
-            if item_info and not item_info["is_ignored"]:
-                # Update tree item
-                values = list(self.tree.item(child_id, "values"))
-                values[0] = "✅" if checked else "⬜"
-                self.tree.item(child_id, values=values)
+            if item_info:
+                self.set_checked(child_id, item_info, checked)
                 
-                # Update checked items set
-                if checked:
-                    self.checked_items.add(child_id)
-                else:
-                    self.checked_items.discard(child_id)
-                
-                # Recursively update children if it's a directory
-                if item_info["type"] == "directory":
-                    self.update_children_check(child_id, checked)
+                # Update children too if it's a directory
+                if item_info.is_dir:
+                    stack.extend(self.tree.get_children(child_id))
     
     def check_all(self):
         """Check all items in the tree"""
-        for item_id in self.tree.get_children():
-            item_info = self.tree_items.get(item_id)
-            if item_info and not item_info["is_ignored"]:
-                values = list(self.tree.item(item_id, "values"))
-                values[0] = "✅"
-                self.tree.item(item_id, values=values)
-                self.checked_items.add(item_id)
-                
-                if item_info["type"] == "directory":
-                    self.update_children_check(item_id, True)
+        self.update_children_check("", True)
     
     def uncheck_all(self):
         """Uncheck all items in the tree"""
-        for item_id in self.tree.get_children():
-            item_info = self.tree_items.get(item_id)
-            if item_info and not item_info["is_ignored"]:
-                values = list(self.tree.item(item_id, "values"))
-                values[0] = "⬜"
-                self.tree.item(item_id, values=values)
-                self.checked_items.discard(item_id)
-                
-                if item_info["type"] == "directory":
-                    self.update_children_check(item_id, False)
+        self.update_children_check("", False)
     
     def show_copy_notification(self):
         """Show a notification that content was copied to clipboard"""
@@ -573,76 +999,97 @@ class FileTreeViewer(tk.Tk):
     
     def generate_output(self):
         """Generate text output based on checked items"""
+        # Skip if already generating
+        if self.is_generating:
+            return
+        
         # Start with root directory
         directory = self.current_dir.get()
-        output = f"ContentTree: {directory}\n"
+        parts = [f"ContentTree: {directory}\n"]
         
-        # Process top-level items
-        for item_id in self.tree.get_children():
-            output += self.process_item_for_output(item_id, "")
+        # Copy the loaded part of the tree; the rest is listed from disk by the thread
+        children = self.snapshot_children("")
         
-        # Save to clipboard
+        self.is_generating = True
+        self.status_text.set("Reading files...")
+        
+        threading.Thread(
+            target=self.read_contents_thread,
+            args=(parts, children, self.loaded_dir, self.ignore_matcher),
+            daemon=True
+        ).start()
+    
+    def snapshot_children(self, parent_id):
+        """Copy the loaded items below an item as (path, is_dir, checked, children) tuples"""
+        # Finish inserting anything already scanned, so no items are missing
+        self.flush_inserts()
+        
+        # Directories that were never opened get None for children, and
+        # error rows become None entries
+        snapshot = []
+        stack = [(parent_id, snapshot)]
+        while stack:
+            item_id, children = stack.pop()
+            for child_id in self.tree.get_children(item_id):
+                item_info = self.tree_items.get(child_id)
+                if not item_info:
+                    children.append(None)
+                    continue
+                
+                grandchildren = None
+                if item_info.is_dir and item_info.expanded:
+                    grandchildren = []
+                    stack.append((child_id, grandchildren))
+                children.append((item_info.path, item_info.is_dir, item_info.checked, grandchildren))
+        return snapshot
+    
+    def read_contents_thread(self, parts, children, root, matcher):
+        """Background thread to lay out the output and read checked files into their place"""
+        try:
+            # Lay out all items below the root; checked files are read afterwards
+            contents = []
+            process_items_for_output(children, root, matcher, parts, contents)
+            
+            total = len(contents)
+            paths = [path for _, path, _ in contents]
+            
+            with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+                results = executor.map(get_file_content, paths)
+                for done, ((index, _, child_prefix), content) in enumerate(zip(contents, results), 1):
+                    # Format content with prefix
+                    parts[index] = child_prefix + content.replace("\n", "\n" + child_prefix) + "\n"
+                    
+                    if done % 50 == 0:
+                        # We need to use after to update the status from the main thread
+                        self.after(0, lambda done=done: self.status_text.set(f"Reading files... {done}/{total}"))
+            
+            self.after(0, lambda: self.finish_output(parts))
+        except Exception as e:
+            message = f"Error generating output: {str(e)}"
+            self.after(0, lambda: self.status_text.set(message))
+            self.after(0, lambda: setattr(self, 'is_generating', False))
+    
+    def finish_output(self, parts):
+        """Copy the generated output to the clipboard"""
+        # Save to clipboard in chunks, so the whole output is never joined
+        # into one string next to its fragments
         self.clipboard_clear()
-        self.clipboard_append(output)
+        chunk = []
+        chunk_size = 0
+        for part in parts:
+            chunk.append(part)
+            chunk_size += len(part)
+            if chunk_size >= CLIPBOARD_CHUNK_SIZE:
+                self.clipboard_append("".join(chunk))
+                chunk = []
+                chunk_size = 0
+        if chunk:
+            self.clipboard_append("".join(chunk))
         
         # Show status and notification
         self.status_text.set("Output generated and copied to clipboard")
         self.show_copy_notification()
-    
-    def process_item_for_output(self, item_id, prefix):
-        """Process a tree item for output generation"""
-        item_info = self.tree_items.get(item_id)
-        if not item_info:
-            return ""
-            
-        # Get item properties
-        name = os.path.basename(item_info["path"])
-        is_checked = item_id in self.checked_items
-        is_last = self.tree.next(item_id) == ""
-        item_prefix = prefix + ("└── " if is_last else "├── ")
-        child_prefix = prefix + ("    " if is_last else "│   ")
-        
-        output = item_prefix + name + "\n"
-        
-        # For files, include content if checked
-        if item_info["type"] == "file":
-            if is_checked:
-                content = get_file_content(item_info["path"])
-                # Format content with prefix
-                formatted_content = '\n'.join([child_prefix + line for line in content.split('\n')])
-                output += formatted_content + "\n"
-                output += child_prefix + "-" * 40 + "\n"
-            else:
-                output += child_prefix + "<-- Content skipped -->\n"
-        
-        # For directories, process children if not ignored
-        elif item_info["type"] == "directory" and not item_info["is_ignored"]:
-            if item_info["path"].endswith("node_modules"):
-                output += child_prefix + "<-- node_modules (skipped) -->\n"
-            else:
-                # Process children
-                children = self.tree.get_children(item_id)
-                if not children:
-                    # Empty directory
-                    output += child_prefix + "(empty directory)\n"
-                else:
-                    # Process each child
-                    for i, child_id in enumerate(children):
-                        is_last_child = (i == len(children) - 1)
-                        child_info = self.tree_items.get(child_id)
-                        
-                        if child_info:
-                            if child_id in self.checked_items or child_info["type"] == "directory":
-                                output += self.process_item_for_output(child_id, child_prefix)
-                            else:
-                                # Add simple entry for unchecked files
-                                child_name = os.path.basename(child_info["path"])
-                                child_item_prefix = child_prefix + ("└── " if is_last_child else "├── ")
-                                child_content_prefix = child_prefix + ("    " if is_last_child else "│   ")
-                                output += child_item_prefix + child_name + "\n"
-                                output += child_content_prefix + "<-- Content skipped -->\n"
-        
-        return output
+        self.is_generating = False
     
     def edit_ignored_patterns(self):
         """Edit ignored patterns dialog"""
@@ -676,7 +1123,7 @@ class FileTreeViewer(tk.Tk):
             
             # Update config
             self.config_data["ignored_patterns"] = new_patterns
-            save_config(self.config_data)
+            self.config_writer.save(self.config_data)
             
             # Close dialog
             dialog.destroy()
@@ -721,7 +1168,7 @@ class FileTreeViewer(tk.Tk):
         """Handle window close event"""
         # Save window size to config
         self.config_data["window_size"] = [self.winfo_width(), self.winfo_height()]
-        save_config(self.config_data)
+        self.config_writer.flush(self.config_data)
         
         # Destroy window
         self.destroy()